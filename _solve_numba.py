@@ -0,0 +1,75 @@
+"""
+Compiled backtrack kernel for the cryptarithmetic problem.
+Requires numba. CryptArithmeticBTSolver falls back to pure Python if this module can't be imported
+"""
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def solve(order, domains, coef, remaining_slack, base):
+    """
+    Iterative backtrack algorithm, using an explicit stack instead of recursion.
+    Branches are pruned when the remaining variables can't bring sum(coef * value) back to 0
+    :param order: variables indices in the order they are instantiated
+    :param domains: domain of each variable as a boolean row (True if the value is available)
+    :param coef: place-value coefficient of each variable
+    :param remaining_slack: largest magnitude the variables order[k:] can still add to sum(coef * value)
+    :param base: arithmetic base
+    :return: (found, values) where values holds the value of each variable
+    """
+    n = order.shape[0]
+    values = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return True, values
+    next_value = np.zeros(n, dtype=np.int64)  # Next value to try at each depth
+    partial = np.zeros(n + 1, dtype=np.int64)  # sum(coef * value) of the variables instantiated above each depth
+    # Values taken by instantiated variables. An array rather than a bitmask, so any base fits
+    used = np.zeros(base, dtype=np.bool_)
+    depth = 0
+    while depth >= 0:
+        v = order[depth]
+        if values[v] >= 0:
+            # Undo the previous value tried at this depth
+            used[values[v]] = False
+            values[v] = -1
+        d = next_value[depth]
+        while d < base and (not domains[v, d] or used[d]
+                            or abs(partial[depth] + coef[v] * d) > remaining_slack[depth + 1]):
+            d += 1
+        if d == base:
+            next_value[depth] = 0
+            depth -= 1
+            continue
+        next_value[depth] = d + 1
+        values[v] = d
+        used[d] = True
+        partial[depth + 1] = partial[depth] + coef[v] * d
+        if depth == n - 1:
+            # remaining_slack[n] is 0: the sum is exactly 0
+            return True, values
+        depth += 1
+    return False, values
+
+
+def solve_words(vars_, domains: list, coef: list, remaining_slack: list, base: int):
+    """
+    Encode the problem as integer arrays and run the compiled kernel.
+    The caller must make sure remaining_slack[0] fits in int64
+    :param vars_: ordered list of variables ids
+    :param domains: domains as bitmasks, indexed by variable id
+    :param coef: place-value coefficient of each variable, indexed by variable id
+    :param remaining_slack: largest magnitude the variables vars_[k:] can still add to sum(coef * value)
+    :param base: arithmetic base
+    :return: list of values indexed by variable id if a solution is found, False otherwise
+    """
+    order = np.array(vars_, dtype=np.int8)
+    domains_rows = np.array([[(m >> d) & 1 for d in range(base)] for m in domains], dtype=np.bool_).reshape(-1, base)
+    coef_vec = np.array(coef, dtype=np.int64)
+    slack_vec = np.array(remaining_slack, dtype=np.int64)
+
+    found, values = solve(order, domains_rows, coef_vec, slack_vec, base)
+    if not found:
+        return False
+    return [int(d) for d in values]
@@ -1,18 +1,36 @@
-import copy
+import itertools
+import multiprocessing
 import random
 import time
+from array import array
 from collections import Counter
+from operator import itemgetter, mul
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy not available: permutations are checked one by one
+    np = None
+
+try:
+    from _solve_numba import solve_words as numba_solve_words
+except ImportError:
+    # numba not available: pure Python search
+    numba_solve_words = None
 
 
 class CryptArithmeticBTSolver:
     """
     CSP solver for cryptarithmetic problems.
-    Implements backtrack and forward-checking algorithms
+    Implements backtrack and forward-checking algorithms, and an enumeration of the permutations of values.
+    Backtrack runs a compiled kernel when numba is installed and logs are disabled
     """
 
     NO_LOGGING = 0  # Don't show logs
     SHOW_LOGS = 1  # Show logs
 
+    PERMUTATIONS_BLOCK_SIZE = 1 << 16  # Permutations checked at once when numpy is available
+
     def __init__(self, words: [str], answer: str, base: int = 10):
         """
         Init the solver
@@ -22,9 +40,12 @@ class CryptArithmeticBTSolver:
             base: arithmetic base. 10 by default (decimal numbers)
         Attributes:
             variables: list of variables
-            domains: dictionary of the domains
+            domains: dictionary of the domains. Each domain is a bitmask (bit d set if value d is available)
+            coef: place-value coefficient of each variable. The operation holds iff sum(coef * value) == 0
             logging_level: show logs or not
             __solving_time: solving time
+            __deg_order: cached deg ordering of the variables. None until computed
+            __last_solution: result of the last solve. None until solved
         """
         self.words = words
         self.answer = answer
@@ -32,6 +53,9 @@ class CryptArithmeticBTSolver:
         # self.variables_dict = {}
         self.variables = []
         self.domains = {}
+        self.coef = Counter()
+        self.__deg_order = None
+        self.__last_solution = None
         self.__reset_model()
         self.logging_level = self.NO_LOGGING
         self.__solving_time = 0
@@ -45,7 +69,37 @@ class CryptArithmeticBTSolver:
         for w in self.words + [self.answer]:
             letters_set.update(list(w))
         self.variables = letters_set
-        self.domains = {v: list(range(10)) for v in self.variables}
+        # Letters are interned as contiguous int ids. The search only works on ids
+        self.__id_to_letter = list(letters_set)
+        self.__letter_to_id = {ch: i for i, ch in enumerate(self.__id_to_letter)}
+        self.__words_ids = [[self.__letter_to_id[ch] for ch in w] for w in self.words]
+        self.__answer_ids = [self.__letter_to_id[ch] for ch in self.answer]
+        # Leading letters of multi-digit words can't be 0
+        leading = {w[0] for w in self.__words_ids + [self.__answer_ids] if len(w) > 1}
+        full_domain = (1 << self.base) - 1
+        self.__domains_ids = [full_domain & ~1 if v in leading else full_domain for v in range(len(letters_set))]
+        self.domains = {ch: self.__domains_ids[v] for v, ch in enumerate(self.__id_to_letter)}
+
+    def __build_coefficients(self):
+        """
+        Build the place-value coefficient of each variable: positive for the operands, negative for the result
+        :return:
+        """
+        coef = [0] * len(self.__id_to_letter)
+        for w in self.__words_ids:
+            for i, v in enumerate(w):
+                coef[v] += self.base ** (len(w) - 1 - i)
+        for i, v in enumerate(self.__answer_ids):
+            coef[v] -= self.base ** (len(self.__answer_ids) - 1 - i)
+        self.__coef_ids = coef
+        self.coef = Counter({ch: coef[v] for v, ch in enumerate(self.__id_to_letter)})
+        # Flattened copy for the leaf check: non-zero coefficients and a getter of the matching values
+        indices = [v for v, c in enumerate(coef) if c != 0]
+        self.__leaf_coef = [coef[v] for v in indices]
+        if len(indices) > 1:
+            self.__leaf_values = itemgetter(*indices)
+        else:
+            self.__leaf_values = lambda assignment: tuple(assignment[i] for i in indices)
 
     def __reset_model(self):
         """
@@ -53,6 +107,9 @@ class CryptArithmeticBTSolver:
         :return:
         """
         self.__build_variables()
+        self.__build_coefficients()
+        self.__deg_order = None
+        self.__last_solution = None
 
     def set_words(self, words: [str]):
         """
@@ -72,88 +129,60 @@ class CryptArithmeticBTSolver:
         self.answer = answer
         self.__reset_model()
 
-    def __get_num_value(self, word: str, assignment: dict):
+    def __new_assignment(self):
         """
-        Get numerical value of an instantion
-        :param word: string of variables
-        :param assignment: instantiation
-        :return: Numerical value or None
+        Helper function to create an empty instantiation: an array of values indexed by variable, -1 if not instantiated
+        :return: array
         """
-        ln = len(word)
-        out = None
-        for i, ch in enumerate(word):
-            if i == 0:
-                out = assignment[ch] * (self.base ** (ln - 1))
-            else:
-                out = out + assignment[ch] * (self.base ** (ln - (1 + i)))
-        return out
+        return array('h', [-1] * len(self.__id_to_letter))
 
-    def __make_sum(self, words_list: list[str], assignment: dict):
+    def __assignment_to_dict(self, assignment):
         """
-        Helper function. Get numerical value of all operands and sum them
-        :param words_list: list of words
+        Helper function to convert an instantiation array to a dictionary of letter, value key pairs
         :param assignment: instantiation
-        :return: numerical sum of the operands
+        :return: dict. Variables not instantiated are None
         """
-        out = None
-        for i, w in enumerate(words_list):
-            if i == 0:
-                out = self.__get_num_value(w, assignment)
-            else:
-                out = out + self.__get_num_value(w, assignment)
-        return out
+        return {ch: (assignment[v] if assignment[v] >= 0 else None) for v, ch in enumerate(self.__id_to_letter)}
 
-    def __check_constraints(self, assignment: dict):
+    def __check_constraints(self, assignment: array):
         """
         Check that instantiation is valid
         :param assignment: instantiation
         :return: True if verified. False otherwise
         """
-        # values = assignment.values()
-        # if len(values) != len(set(values)):
-        #     return False
-        return self.__check_all_diff(assignment) and self.__make_sum(words_list=self.words, assignment=assignment) \
-               == self.__get_num_value(self.answer, assignment)
-
-    @staticmethod
-    def __check_all_diff(assignment: dict, exclude_nones=True):
-        """
-        Check all diff constraint
-        :param assignment: instantiation
-        :param exclude_nones: exclude variables None values (not instantiated)
-        :return: True if verified. False otherwise
-        """
-        values = assignment.values()
-        if exclude_nones:
-            values = [v for v in values if v is not None]
-        if len(values) != len(set(values)):
-            return False
-        return True
+        # All diff constraint is enforced incrementally during the search (used values / pruned domains)
+        return sum(map(mul, self.__leaf_coef, self.__leaf_values(assignment))) == 0
 
     @staticmethod
-    def __pick_variable(vars_, local_assignment: dict):
-        """
-        Helper function to pick a non-instantiated variable
-        :param vars_: list of variables
-        :param local_assignment: current instantiation
-        :return: Selected variable or None if all variable have been instantiated
+    def __rank_variables(words: [list], answer: list, coef: list):
+        """
+        Helper function to rank variables with respect to the magnitude of their coefficient in sum(coef * value).
+        Most significant letters come first, so the bound on the partial sum prunes as early as possible.
+        Ties are broken by leading letters (smaller domain) then by occurrences
+        :param words: list of operands, as lists of variables
+        :param answer: result of operation, as a list of variables
+        :param coef: place-value coefficient of each variable
+        :return: ordered list of variables
         """
-        instantiated_vars = [v for v, d in local_assignment.items() if d is not None]
-        for v in vars_:
-            if v not in instantiated_vars:
-                return v
-        return None
+        all_words = words + [answer]
+        counter_dict = Counter(v for w in all_words for v in w)
+        leading = {w[0] for w in all_words if len(w) > 1}
+        return sorted((v for v, _ in counter_dict.most_common()),
+                      key=lambda v: (abs(coef[v]), v in leading, counter_dict[v]), reverse=True)
 
-    @staticmethod
-    def __rank_variables(words: [str], answer: str):
+    def __order_variables(self, variables_ordering='deg'):
         """
-        Helper function to rank variables with respect to occurrences
-        :param words: list of operands
-        :param answer: result of operation
-        :return: ordered list of variables
+        Helper function to order variables. The deg ordering is computed once per model
+        :param variables_ordering: Ordering to use for vriables. {deg, random}
+        :return: ordered list of variables ids
         """
-        counter_dict = Counter(''.join(words + [answer]))
-        return [v[0] for v in counter_dict.most_common()]
+        if variables_ordering.lower() == 'deg':
+            if self.__deg_order is None:
+                self.__deg_order = self.__rank_variables(self.__words_ids, self.__answer_ids, self.__coef_ids)
+            return list(self.__deg_order)
+        vars_ = list(range(len(self.__id_to_letter)))
+        random.shuffle(vars_)
+        return vars_
 
     def backtrack(self, variables_ordering='deg'):
         """
@@ -162,37 +191,57 @@ class CryptArithmeticBTSolver:
         :return: Solution if found, False otherwise
         """
 
-        if variables_ordering.lower() == 'deg':
-            vars_ = self.__rank_variables(self.words, self.answer)
-        else:
-            vars_ = list(copy.deepcopy(self.variables))
-            random.shuffle(vars_)
+        vars_ = self.__order_variables(variables_ordering)
         # print(vars_)
 
-        def backtrack_util(local_assignment: dict, i=0):
+        coef = self.__coef_ids
+        domains = self.__domains_ids
+
+        # remaining_slack[k]: largest magnitude the variables vars_[k:] can still add to sum(coef * value)
+        remaining_slack = [0] * (len(vars_) + 1)
+        for k in range(len(vars_) - 1, -1, -1):
+            remaining_slack[k] = remaining_slack[k + 1] + abs(coef[vars_[k]]) * (self.base - 1)
+
+        # The compiled kernel sums in int64: partial sums are bounded by 2 * remaining_slack[0]
+        if numba_solve_words is not None and self.logging_level == self.NO_LOGGING \
+                and remaining_slack[0] < 2 ** 62:
+            if len(self.variables) > 10:
+                return False
+            values = numba_solve_words(vars_, domains, coef, remaining_slack, self.base)
+            return self.__assignment_to_dict(values) if values else False
+
+        def backtrack_util(local_assignment: array, i=0, used_mask=0, partial=0):
             if self.logging_level == self.SHOW_LOGS:
-                print(i, '-', local_assignment)
-            v = self.__pick_variable(vars_, local_assignment)
-            if not v:
-                # return True
+                print(i, '-', self.__assignment_to_dict(local_assignment))
+            # Variables are instantiated in the order of vars_: the i-th one is next
+            if i == len(vars_):
                 return self.__check_constraints(local_assignment)
+            v = vars_[i]
 
-            for d in self.domains[v]:
+            # used_mask holds the values already taken by instantiated variables (all diff constraint)
+            # partial is sum(coef * value) over instantiated variables
+            coef_v = coef[v]
+            m = domains[v]
+            while m:
+                bit = m & -m
+                m ^= bit
+                if used_mask & bit:
+                    continue
+                d = bit.bit_length() - 1
+                new_partial = partial + coef_v * d
+                if abs(new_partial) > remaining_slack[i + 1]:
+                    # The remaining variables can't bring the sum back to 0
+                    continue
                 local_assignment[v] = d
-                if self.__check_all_diff(local_assignment):
-                    if backtrack_util(local_assignment, i + 1):
-                        return True
-            local_assignment[v] = None
+                if backtrack_util(local_assignment, i + 1, used_mask | bit, new_partial):
+                    return True
+            local_assignment[v] = -1
 
-        I = {}
         if len(self.variables) > 10:
             return False
-        for i, ch in enumerate(self.variables):
-            I[ch] = None
-        # print(variables)
-        # print(I)
+        I = self.__new_assignment()
         if backtrack_util(I):
-            return I
+            return self.__assignment_to_dict(I)
         return False
 
     def forward_checking(self, variables_ordering='deg'):
@@ -201,78 +250,160 @@ class CryptArithmeticBTSolver:
         :param variables_ordering: Ordering to use for vriables. {deg, random}
         :return: Solution if found, False otherwise
         """
-        if variables_ordering.lower() == 'deg':
-            vars_ = self.__rank_variables(self.words, self.answer)
-        else:
-            vars_ = list(copy.deepcopy(self.variables))
-            random.shuffle(vars_)
+        vars_ = self.__order_variables(variables_ordering)
         # print(vars_)
 
-        def fc_util(local_assignment: dict, domains_: dict, i=0):
+        def fc_util(local_assignment: array, domains_: list, i=0):
             if self.logging_level == self.SHOW_LOGS:
-                print(i, '-', local_assignment)
-            i += 1
-            v = self.__pick_variable(vars_, local_assignment)
-            if not v:
-                # return True
+                print(i, '-', self.__assignment_to_dict(local_assignment))
+            # Variables are instantiated in the order of vars_: the i-th one is next
+            if i == len(vars_):
                 return self.__check_constraints(local_assignment)
+            v = vars_[i]
 
             domain_v = domains_[v]
-            for d in domain_v:
-                domains_[v] = [d]
-                local_assignment[v] = d
-                domains_before_pruning = copy.deepcopy(domains_)
-                # Remove inconsistent values from other variables
+            m = domain_v
+            while m:
+                bit = m & -m
+                m ^= bit
+                domains_[v] = bit
+                local_assignment[v] = bit.bit_length() - 1
+                # Remove inconsistent values from other variables.
+                # Previous domains are kept on a trail so they can be restored on backtrack.
+                # Assigned values are pruned from the other domains, so all diff holds by construction
+                trail = []
                 empty_domain_detected = False
                 for vj in vars_:
-                    if vj != v:
-                        try:
-                            domains_[vj].remove(d)
-                        except ValueError:
-                            # print()
-                            ...
-                        empty_domain_detected = not domains_[vj]
+                    if vj == v or local_assignment[vj] >= 0:
+                        continue
+                    old = domains_[vj]
+                    if old & bit:
+                        domains_[vj] = old ^ bit
+                        trail.append((vj, old))
+                        if old == bit:
+                            # Domain wiped out: no need to prune the other variables
+                            empty_domain_detected = True
+                            break
                 if not empty_domain_detected:
-                    if self.__check_all_diff(local_assignment):
-                        if fc_util(local_assignment, domains_, i):
-                            return True
-                domains_ = copy.deepcopy(domains_before_pruning)  # Restoring domains
-            local_assignment[v] = None
+                    if fc_util(local_assignment, domains_, i + 1):
+                        return True
+                for vj, old in trail:
+                    domains_[vj] = old  # Restoring domains
+            domains_[v] = domain_v
+            local_assignment[v] = -1
 
-        I = {}
         if len(self.variables) > 10:
             return False
-        for i, ch in enumerate(self.variables):
-            I[ch] = None
-        # print(variables)
-        # print(I)
-        if fc_util(I, copy.deepcopy(self.domains), 0):
-            return I
+        I = self.__new_assignment()
+        if fc_util(I, list(self.__domains_ids), 0):
+            return self.__assignment_to_dict(I)
         return False
 
-    def solve(self, solver='bt', variables_ordering='deg'):
+    def permutations(self, variables_ordering='deg'):
+        """
+        Enumerate all the injective instantiations with itertools.permutations (all diff holds by construction)
+        and check the sum of each one. The enumeration runs in C, with no recursion
+        :param variables_ordering: Ordering to use for vriables. {deg, random}
+        :return: Solution if found, False otherwise
+        """
+        vars_ = self.__order_variables(variables_ordering)
+        if len(self.variables) > 10:
+            return False
+        coef = [self.__coef_ids[v] for v in vars_]
+        # Positions of the variables which can't be 0 (leading letters)
+        non_zero = [k for k, v in enumerate(vars_) if not self.__domains_ids[v] & 1]
+        if np is not None and sum(map(abs, coef)) * (self.base - 1) < 2 ** 63:
+            sol = self.__find_permutation_numpy(len(vars_), coef, non_zero)
+        else:
+            # Sums may not fit in int64: Python ints
+            sol = next((perm for perm in itertools.permutations(range(self.base), len(vars_))
+                        if sum(map(mul, coef, perm)) == 0 and all(perm[k] for k in non_zero)), None)
+        if sol is None:
+            return False
+        I = self.__new_assignment()
+        for v, d in zip(vars_, sol):
+            I[v] = int(d)
+        return self.__assignment_to_dict(I)
+
+    def __find_permutation_numpy(self, n, coef: list, non_zero: list):
+        """
+        Helper function. Check the permutations by blocks: one matrix product gives the sums of a whole block
+        :param n: number of variables
+        :param coef: coefficients of the variables, in the order of the permutations
+        :param non_zero: positions of the variables which can't be 0
+        :return: first valid permutation or None
+        """
+        coef_vec = np.array(coef, dtype=np.int64)
+        perms = itertools.permutations(range(self.base), n)
+        while True:
+            block = np.fromiter(itertools.chain.from_iterable(itertools.islice(perms, self.PERMUTATIONS_BLOCK_SIZE)),
+                                dtype=np.int16)
+            if not block.size:
+                return None
+            rows = block.reshape(-1, n)
+            valid = rows @ coef_vec == 0
+            if non_zero:
+                valid &= (rows[:, non_zero] != 0).all(axis=1)
+            hits = np.flatnonzero(valid)
+            if hits.size:
+                return rows[hits[0]]
+
+    def solve(self, solver='bt', variables_ordering='deg', parallel=1):
         """
         Solve the problem.
-        :param solver: Algorithm to use. {bt for Backtrack, fc for Forward checking}
+        :param solver: Algorithm to use. {bt for Backtrack, fc for Forward checking, perm for Permutations}
         :param variable_ordering: 'deg' for deg (the number of constraints), 'random' for random ordering
+        :param parallel: number of processes running the random ordering concurrently. Ignored with 'deg'
         :return: solution as dict or None if no solution
         """
         start = time.time()
-        if solver.lower() == 'fc':
-            algo = self.forward_checking
+        if parallel > 1 and variables_ordering.lower() == 'random':
+            sol = self.__solve_parallel(solver, parallel)
         else:
-            # BT by default
-            algo = self.backtrack
-        sol = algo(variables_ordering=variables_ordering)
+            if solver.lower() == 'fc':
+                algo = self.forward_checking
+            elif solver.lower() == 'perm':
+                algo = self.permutations
+            else:
+                # BT by default
+                algo = self.backtrack
+            sol = algo(variables_ordering=variables_ordering)
         self.solving_time = time.time() - start
+        self.__last_solution = sol
         return sol
 
+    def __solve_parallel(self, solver, parallel):
+        """
+        Run the algorithm with a different random ordering in each process and keep the first result.
+        Each run is a complete search, so the first one to finish is conclusive: the other ones are terminated
+        :param solver: Algorithm to use. {bt for Backtrack, fc for Forward checking}
+        :param parallel: number of processes
+        :return: Solution if found, False otherwise
+        """
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_solve_random_ordering,
+                                           args=((self.words, self.answer, self.base, solver, self.logging_level,
+                                                  random.randrange(2 ** 32)), results),
+                                           daemon=True)
+                   for _ in range(parallel)]
+        for worker in workers:
+            worker.start()
+        try:
+            return results.get()
+        finally:
+            # The queue isn't used after the first result, so the runs still in progress can be killed safely
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
+            results.close()
+
     def print_solution(self):
         """
         Print solution in a convenient way
         :return:
         """
-        sol = self.solve()
+        sol = self.__last_solution if self.__last_solution is not None else self.solve()
         print('sol', sol)
         if not sol:
             print("No solution")
@@ -302,7 +433,18 @@ class CryptArithmeticBTSolver:
         :param solution: dict
         :return: str
         """
-        out = ''
-        for ch in word:
-            out += str(solution[ch])
-        return out
+        return ''.join(str(solution[ch]) for ch in word)
+
+
+def _solve_random_ordering(task, results):
+    """
+    Worker of CryptArithmeticBTSolver parallel solving. Builds its own solver and runs it with a seeded random ordering
+    :param task: tuple (words, answer, base, solver, logging_level, seed)
+    :param results: multiprocessing.Queue receiving the solution if found, False otherwise
+    :return:
+    """
+    words, answer, base, solver, logging_level, seed = task
+    random.seed(seed)
+    bt_solver = CryptArithmeticBTSolver(words=words, answer=answer, base=base)
+    bt_solver.logging_level = logging_level
+    results.put(bt_solver.solve(solver=solver, variables_ordering='random'))
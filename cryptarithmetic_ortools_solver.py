@@ -1,3 +1,5 @@
+import os
+
 from ortools.sat.python import cp_model
 
 
@@ -18,7 +20,8 @@ class CryptArithmeticOrtoolsSolver:
             variables: list of variables
             variables_dict: variables as a dictionnary of letter, Variable instance key pairs
             model: CpModel instance
-            model: CpSolver instance
+            solver: CpSolver instance
+            __last_solution: result of the last solve. None until solved
         """
         self.words = words
         self.answer = answer
@@ -26,8 +29,11 @@ class CryptArithmeticOrtoolsSolver:
         self.variables_dict = {}
         self.variables = []
         self.model = None
+        self.__last_solution = None
         self.__reset_model()
         self.solver = cp_model.CpSolver()
+        # Portfolio search on all the cores
+        self.solver.parameters.num_workers = max(1, os.cpu_count() or 1)
 
     def __build_variables(self):
         """
@@ -39,10 +45,15 @@ class CryptArithmeticOrtoolsSolver:
         for w in self.words + [self.answer]:
             letters_set.update(list(w))
 
+        # Leading letters of multi-digit words can't be 0
+        leading = {w[0] for w in self.words + [self.answer] if len(w) > 1}
+
         self.variables = [None for _ in letters_set]
+        self.variables_dict = {}
 
         for i, letter in enumerate(letters_set):
-            self.variables[i] = self.model.NewIntVar(0, self.base-1, letter)
+            lower_bound = 1 if letter in leading else 0
+            self.variables[i] = self.model.NewIntVar(lower_bound, self.base-1, letter)
             self.variables_dict[letter] = self.variables[i]
 
     def __build_constraints(self):
@@ -50,9 +61,40 @@ class CryptArithmeticOrtoolsSolver:
         Build variables constraints
         :return:
         """
-        self.model.Add(self.__make_sum(self.words) == self.__get_num_value(self.answer))
+        self.__build_column_constraints()
         self.model.AddAllDifferent(self.variables)
 
+    def __build_column_constraints(self):
+        """
+        Build the sum constraint column by column, from the least significant digit, with a carry variable per column:
+        sum of the column letters + previous carry == result letter + base * carry
+        :return:
+        """
+        # Letters of each word, least significant first. Missing positions count as 0
+        columns = [w[::-1] for w in self.words]
+        answer = self.answer[::-1]
+        n_cols = max([len(answer)] + [len(w) for w in columns])
+        max_carry = max(len(self.words) - 1, 0)
+        carry_in = None
+        for j in range(n_cols):
+            carry_out = self.model.NewIntVar(0, max_carry, 'carry_%i' % j)
+            # Single weighted sum per column: letters + carry_in - answer letter - base * carry_out == 0
+            expressions = [self.variables_dict[w[j]] for w in columns if j < len(w)]
+            coefficients = [1] * len(expressions)
+            if carry_in is not None:
+                expressions.append(carry_in)
+                coefficients.append(1)
+            if j < len(answer):
+                expressions.append(self.variables_dict[answer[j]])
+                coefficients.append(-1)
+            expressions.append(carry_out)
+            coefficients.append(-self.base)
+            self.model.Add(cp_model.LinearExpr.WeightedSum(expressions, coefficients) == 0)
+            carry_in = carry_out
+        # No carry out of the most significant column
+        if n_cols:
+            self.model.Add(carry_in == 0)
+
     def __reset_model(self):
         """
         Reset variables with their domains
@@ -61,6 +103,7 @@ class CryptArithmeticOrtoolsSolver:
         self.model = cp_model.CpModel()
         self.__build_variables()
         self.__build_constraints()
+        self.__last_solution = None
 
     def set_words(self, words: [str]):
         """
@@ -80,47 +123,20 @@ class CryptArithmeticOrtoolsSolver:
         self.answer = answer
         self.__reset_model()
 
-    def __get_num_value(self, word: str):
-        """
-        Get numerical value of an instantion
-        :param word: string of variables
-        :return: Numerical value or None
-        """
-        ln = len(word)
-        out = None
-        for i, ch in enumerate(word):
-            if i == 0:
-                out = self.variables_dict[ch] * (self.base ** (ln - 1))
-            else:
-                out = out + self.variables_dict[ch] * (self.base ** (ln - (1 + i)))
-        return out
-
-    def __make_sum(self, words_list: list[str]):
-        """
-        Helper function. Get numerical value of all operands and sum them
-        :param words_list: list of words
-        :return: numerical sum of the operands
-        """
-        out = None
-        for i, w in enumerate(words_list):
-            if i == 0:
-                out = self.__get_num_value(w)
-            else:
-                out = out + self.__get_num_value(w)
-        return out
-
-    def solve(self):
+    def solve(self, time_limit=None):
         """
         Solve the problem.
-        :return: solution or empty dict if no solution
+        :param time_limit: maximum solving time in seconds. None for no limit
+        :return: solution or empty dict if no solution (or none found within the time limit)
         """
+        self.solver.parameters.max_time_in_seconds = float('inf') if time_limit is None else time_limit
         status = self.solver.Solve(self.model)
+        out = {}
         if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            out = {}
             for k, v in self.variables_dict.items():
                 out[k] = self.solver.Value(v)
-            return out
-        return {}
+        self.__last_solution = out
+        return out
 
     @staticmethod
     def word_to_number(word: str, solution: dict):
@@ -130,17 +146,14 @@ class CryptArithmeticOrtoolsSolver:
         :param solution: dict
         :return: str
         """
-        out = ''
-        for ch in word:
-            out += str(solution[ch])
-        return out
+        return ''.join(str(solution[ch]) for ch in word)
 
     def print_solution(self):
         """
         Print solution in a convenient way
         :return:
         """
-        sol = self.solve()
+        sol = self.__last_solution if self.__last_solution is not None else self.solve()
         print('sol', sol)
         if not sol:
             print("No solution")
@@ -156,7 +169,8 @@ class CryptArithmeticOrtoolsSolver:
         Print stats: solving time
         :return:
         """
-        sol = self.solve()
+        if self.__last_solution is None:
+            self.solve()
         print('\nStats')
         print('  - Conflicts: %i' % self.solver.NumConflicts())
         print('  - Branches : %i' % self.solver.NumBranches())
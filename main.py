@@ -14,6 +14,7 @@ while True:
     print('1 - ortools_solver')
     print('2 - Backtrack')
     print('3 - Forward checking')
+    print('4 - Permutations')
     print()
 
     try:
@@ -21,7 +22,7 @@ while True:
     except ValueError:
         print('Wrong input')
         continue
-    if option not in [0, 1, 2, 3]:
+    if option not in [0, 1, 2, 3, 4]:
         print('Wrong option')
         continue
     if option == 0:
@@ -29,8 +30,9 @@ while True:
     words = input('Enter words separated by a space. (For example: POINT ZERO ): \n').upper().split()
     answer = input('Enter answer. (For example: ENERGY): \n').upper()
 
-    if option in [2, 3]:
-        show_logs = input('Show logs ? Y or N: \n')
+    if option in [2, 3, 4]:
+        # Permutations don't log: no need to ask
+        show_logs = input('Show logs ? Y or N: \n') if option != 4 else ''
         if show_logs.strip().upper() in ['Y', 'YES']:
             show_logs = CryptArithmeticBTSolver.SHOW_LOGS
         else:
@@ -40,7 +42,7 @@ while True:
             var_ordering = 'random'
         else:
             var_ordering = 'deg'
-        algo = 'fc' if option == 3 else 'bt'
+        algo = {2: 'bt', 3: 'fc', 4: 'perm'}[option]
         solver = CryptArithmeticBTSolver(words=words, answer=answer)
         solver.logging_level = show_logs
         solver.solve(solver=algo, variables_ordering=var_ordering)
@@ -0,0 +1,29 @@
+import unittest
+
+from cryptarithmetic_bt_solver import CryptArithmeticBTSolver
+
+
+class ParallelSolveTest(unittest.TestCase):
+    """
+    Repeated parallel solves must always return: the runs still in progress are terminated after the first result
+    """
+
+    REPEATS = 20
+
+    def test_parallel_satisfiable(self):
+        for solver in ['bt', 'fc', 'perm']:
+            for _ in range(self.REPEATS):
+                sol = CryptArithmeticBTSolver(['TO', 'GO'], 'OUT').solve(solver=solver, variables_ordering='random',
+                                                                        parallel=3)
+                self.assertEqual(sol, {'T': 2, 'O': 1, 'G': 8, 'U': 0})
+
+    def test_parallel_unsatisfiable(self):
+        for solver in ['bt', 'fc', 'perm']:
+            for _ in range(self.REPEATS):
+                sol = CryptArithmeticBTSolver(['AB', 'AB'], 'BCA').solve(solver=solver, variables_ordering='random',
+                                                                        parallel=3)
+                self.assertFalse(sol)
+
+
+if __name__ == '__main__':
+    unittest.main()